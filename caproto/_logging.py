@@ -0,0 +1,27 @@
+import logging
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+
+# the plain layout of caproto's own log lines
+LOG_FORMAT = ('[%(levelname)1.1s %(asctime)s.%(msecs)03d '
+              '%(module)15s:%(lineno)5d] %(message)s')
+LOG_DATE_FORMAT = '%H:%M:%S'
+
+
+def configure_logging(logger, level):
+    """
+    Send the records of ``logger`` to stdout through a listener thread.
+
+    The event loop only enqueues the records, so it never blocks on writing
+    them out. Lines are formatted like caproto's and go to the same stream.
+    """
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT, LOG_DATE_FORMAT))
+    log_queue = SimpleQueue()
+    logger.setLevel(level)
+    logger.addHandler(QueueHandler(log_queue))
+    logger.propagate = False
+    listener = QueueListener(log_queue, handler)
+    listener.start()
+    return listener
@@ -0,0 +1,163 @@
+import asyncio
+import time
+
+from caproto.server.records import MotorFields
+
+
+class CanMoveEventMixin:
+    """
+    Keep ``can_move_event`` in step with the ``can_move`` property.
+
+    The event is created by :meth:`start_can_move_event`, to be called from
+    the motor startup hook so it lives in the running event loop.
+    """
+    can_move_event = None
+
+    def start_can_move_event(self):
+        self.can_move_event = asyncio.Event()
+        self.update_can_move_event()
+
+    def update_can_move_event(self):
+        if self.can_move_event is None:
+            return
+        if self.can_move:
+            self.can_move_event.set()
+        else:
+            self.can_move_event.clear()
+
+
+async def broadcast_precision_to_fields(record):
+    """Update precision of all fields to that of the given record."""
+
+    precision = record.precision
+    if getattr(record, '_last_broadcast_precision', None) == precision:
+        return
+
+    props = getattr(record, '_precision_fields', None)
+    if props is None:
+        props = tuple(prop for prop in record.field_inst.pvdb.values()
+                      if hasattr(prop, 'precision'))
+        record._precision_fields = props
+
+    for prop in props:
+        await prop.write_metadata(precision=precision)
+    record._last_broadcast_precision = precision
+
+
+async def motor_record_simulator(instance,
+                                 parent,
+                                 async_lib,
+                                 defaults=None,
+                                 tick_rate_hz=10.):
+    """
+    A simple motor record simulator.
+
+    Parameters
+    ----------
+    instance : pvproperty (ChannelDouble)
+        Ensure you set ``record='motor'`` in your pvproperty first.
+
+    parent : PVGroup
+        Group owning the motor, its ``can_move`` property tells whether the
+        motor is allowed to move and its ``can_move_event`` is set as soon
+        as it is.
+
+    async_lib : AsyncLibraryLayer
+
+    defaults : dict, optional
+        Defaults for velocity, precision, acceleration, limits, and resolution.
+
+    tick_rate_hz : float, optional
+        Update rate in Hz.
+    """
+    if defaults is None:
+        defaults = dict(
+            velocity=0.1,
+            precision=3,
+            acceleration=1.0,
+            resolution=1e-6,
+            tick_rate_hz=10.,
+            user_limits=(0.0, 100.0),
+        )
+
+    fields = instance.field_inst  # type: MotorFields
+    have_new_position = False
+
+    async def value_write_hook(fields, value):
+        nonlocal have_new_position
+        # This happens when a user puts to `motor.VAL`
+        # print("New position requested!", value)
+        have_new_position = True
+
+    fields.value_write_hook = value_write_hook
+
+    await instance.write_metadata(precision=defaults['precision'])
+    await broadcast_precision_to_fields(instance)
+
+    await fields.velocity.write(defaults['velocity'])
+    await fields.seconds_to_velocity.write(defaults['acceleration'])
+    await fields.motor_step_size.write(defaults['resolution'])
+    await fields.user_low_limit.write(defaults['user_limits'][0])
+    await fields.user_high_limit.write(defaults['user_limits'][1])
+    await fields.limit_violation.write(0)
+
+    dwell = 1. / tick_rate_hz
+    while True:
+        if not parent.can_move:
+            await parent.can_move_event.wait()
+            continue
+
+        target_pos = instance.value
+        diff = (target_pos - fields.user_readback_value.value)
+        # compute the total movement time based an velocity
+        total_time = abs(diff / fields.velocity.value)
+        # compute how many steps, should come up short as there will
+        # be a final write of the return value outside of this call
+        num_steps = int(total_time // dwell)
+        if fields.stop.value != 0:
+            await fields.stop.write(0)
+        if abs(diff) < 1e-9 and not have_new_position:
+            await async_lib.library.sleep(dwell)
+            continue
+
+        await fields.done_moving_to_value.write(0)
+        await fields.motor_is_moving.write(1)
+
+        start = readback = fields.user_readback_value.value
+        step_size = diff / num_steps if num_steps > 0 else 0.0
+        resolution = max((fields.motor_step_size.value, 1e-10))
+
+        # sleep towards a fixed deadline so the time spent writing the
+        # readbacks does not make the tick rate drift
+        next_tick = time.monotonic()
+        # bind the step loop lookups once per movement
+        stop_field = fields.stop
+        spmg_field = fields.stop_pause_move_go
+        urb_write = fields.user_readback_value.write
+        drb_write = fields.dial_readback_value.write
+        rrb_write = fields.raw_readback_value.write
+        sleep = async_lib.library.sleep
+        monotonic = time.monotonic
+        for step in range(1, num_steps + 1):
+            stop = stop_field.value
+            if stop or spmg_field.value == 'Stop':
+                if stop:
+                    await stop_field.write(0)
+                await instance.write(readback)
+                break
+
+            # derived from the start position, so rounding does not accumulate
+            readback = start + step * step_size
+            raw_readback = readback / resolution
+            await urb_write(readback)
+            await drb_write(readback)
+            await rrb_write(raw_readback)
+            next_tick += dwell
+            await sleep(max(0., next_tick - monotonic()))
+        else:
+            # Only executed if we didn't break
+            await fields.user_readback_value.write(target_pos)
+
+        await fields.motor_is_moving.write(0)
+        await fields.done_moving_to_value.write(1)
+        have_new_position = False
@@ -1,11 +1,25 @@
 #!/usr/bin/env python3
+import asyncio
+import logging
+import socket
+import threading
 import time
-import uuid
+from concurrent.futures import ThreadPoolExecutor
 from textwrap import dedent
-from typing import Tuple
+from typing import List, Tuple
 
 from caproto.server import PVGroup, SubGroup, ioc_arg_parser, pvproperty, run
-from confluent_kafka import Consumer
+from confluent_kafka import TIMESTAMP_NOT_AVAILABLE, Consumer
+
+try:
+    from streaming_data_types.eventdata_ev42 import deserialise_ev42
+except ImportError:
+    # optional, it pulls in numpy and flatbuffers
+    deserialise_ev42 = None
+
+from _logging import configure_logging
+
+logger = logging.getLogger('epicssim.beam_monitor')
 
 
 def get_broker_and_topic_from_uri(uri: str) -> Tuple[str, str]:
@@ -19,46 +33,146 @@ def get_broker_and_topic_from_uri(uri: str) -> Tuple[str, str]:
     return broker, topic
 
 
-def create_consumer(broker_address: str) -> Consumer:
+def create_consumer(broker_address: str, group_id: str) -> Consumer:
+    """
+    Create a consumer that always starts from the latest message.
+
+    ``group_id`` must be unique per IOC: consumers sharing a group split the
+    topic partitions between them. Offsets are never committed, so a restart
+    does not replay the data published while the IOC was down.
+    """
     return Consumer(
         {
             "bootstrap.servers": broker_address,
-            "group.id": uuid.uuid4(),
+            "group.id": group_id,
+            "enable.auto.commit": False,
+            "queued.min.messages": 1000,
+            "queued.max.messages.kbytes": 4096,
+            "fetch.wait.max.ms": 50,
+            "socket.nagle.disable": True,
             "default.topic.config": {"auto.offset.reset": "latest"},
         }
     )
 
 
-async def beam_monitor_simulator(instance, async_lib, consumer):
+def _decode_batch(payloads) -> List[int]:
+    """Return the number of neutron events in each ev42 payload."""
+    counts = [0] * len(payloads)
+    if deserialise_ev42 is None:
+        return counts
+    for index, payload in enumerate(payloads):
+        # the flatbuffer file identifier, skip other schemas on the topic
+        if payload[4:8] != b"ev42":
+            continue
+        try:
+            counts[index] = len(deserialise_ev42(payload).time_of_flight)
+        except Exception:
+            logger.warning('Skipping malformed ev42 message', exc_info=True)
+    return counts
+
+
+async def beam_monitor_simulator(instance, async_lib, queue, pool,
+                                 idle_timeout=2.):
     """
+    Process the batches of messages delivered by the consumer thread.
+
+    Payloads are decoded in ``pool`` and the event rate, in events per
+    second, is written to ``instance``. The rate is timed by the Kafka
+    message timestamps, so it does not depend on when the batches reach the
+    event loop. It drops to 0 when no message arrives for ``idle_timeout``
+    seconds.
     """
-    dwell = 0.001
+    loop = asyncio.get_running_loop()
+    # the events counted since window_start, in Kafka timestamps (ms)
+    window_start = window_end = None
+    events = 0
     while True:
-        message = consumer.consume(1, timeout=1)
-        print(f'message: {message} @ {time.time()}')
-        await async_lib.library.sleep(dwell)
+        try:
+            messages = await asyncio.wait_for(queue.get(), idle_timeout)
+        except asyncio.TimeoutError:
+            window_start = window_end = None
+            events = 0
+            if instance.value != 0:
+                await instance.write(0)
+            continue
+        # tombstones carry no value
+        messages = [message for message in messages
+                    if message is not None and not message.error()
+                    and message.value() is not None]
+        if not messages:
+            continue
+        counts = await loop.run_in_executor(
+            pool, _decode_batch, [message.value() for message in messages])
+        logger.debug('%d events in %d messages', sum(counts), len(messages))
+
+        for message, count in zip(messages, counts):
+            timestamp_type, timestamp = message.timestamp()
+            if window_start is None:
+                if timestamp_type != TIMESTAMP_NOT_AVAILABLE:
+                    # the first message only opens the window, its events
+                    # happened before it
+                    window_start = timestamp
+                continue
+            events += count
+            if timestamp_type != TIMESTAMP_NOT_AVAILABLE:
+                window_end = max(timestamp, window_end or timestamp)
+
+        if window_end is None or window_end <= window_start:
+            continue
+        rate = events / ((window_end - window_start) / 1000.)
+        window_start, window_end = window_end, None
+        events = 0
+        await instance.write(round(rate))
 
 
 class IocBeamMonitor(PVGroup):
     '''
     Hello
     '''
-    rate = pvproperty(value=0, doc='Neutron rate on monitor')
+    rate = pvproperty(value=0, doc='Neutron rate on monitor, in events/s')
 
     def __init__(self, *args,
                  kafka_uri='ess01/amor_detector',
+                 group_id=None,
                  **kwargs):
         super().__init__(*args, **kwargs)
+        if deserialise_ev42 is None:
+            logger.warning('streaming_data_types is not installed, '
+                           'the rate PV will stay at 0')
         broker, topic = get_broker_and_topic_from_uri(kafka_uri)
-        consumer = create_consumer(broker_address=broker)
+        if group_id is None:
+            # unique per IOC: two monitors on one host differ by prefix or topic
+            group_id = f"beam-monitor-{socket.gethostname()}-{self.prefix}{topic}"
+        consumer = create_consumer(broker_address=broker, group_id=group_id)
         consumer.subscribe([topic])
         self.consumer = consumer
+        self._queue = None
+        self._pool = ThreadPoolExecutor(max_workers=1)
+
+    def _consume_loop(self, loop):
+        # Runs in a dedicated thread so librdkafka never blocks the event loop
+        while True:
+            try:
+                batch = self.consumer.consume(num_messages=500, timeout=0.5)
+            except Exception:
+                logger.exception('Failed to consume from Kafka')
+                time.sleep(1)
+                continue
+            if batch:
+                # blocks while the queue is full, so a slow event loop leaves
+                # the backlog in librdkafka's bounded queue
+                asyncio.run_coroutine_threadsafe(self._queue.put(batch),
+                                                 loop).result()
 
     @rate.startup
     async def rate(self, instance, async_lib):
+        self._queue = asyncio.Queue(maxsize=10)
+        threading.Thread(target=self._consume_loop,
+                         args=(asyncio.get_running_loop(),),
+                         daemon=True).start()
         # Start the simulator:
         await beam_monitor_simulator(
-            self.rate, async_lib, self.consumer
+            self.rate, async_lib, self._queue, self._pool
         )
 
 
@@ -66,5 +180,7 @@ if __name__ == '__main__':
     ioc_options, run_options = ioc_arg_parser(
         default_prefix='sim:',
         desc=dedent(IocBeamMonitor.__doc__))
+    # follow the level of the caproto logger, -vv enables the debug records
+    configure_logging(logger, logging.getLogger('caproto').getEffectiveLevel())
     ioc = IocBeamMonitor(**ioc_options)
     run(ioc.pvdb, **run_options)
@@ -4,124 +4,8 @@ from textwrap import dedent
 
 from caproto import ChannelType
 from caproto.server import PVGroup, SubGroup, ioc_arg_parser, pvproperty, run
-from caproto.server.records import MotorFields
 
-
-async def broadcast_precision_to_fields(record):
-    """Update precision of all fields to that of the given record."""
-
-    precision = record.precision
-    for field, prop in record.field_inst.pvdb.items():
-        if hasattr(prop, 'precision'):
-            await prop.write_metadata(precision=precision)
-
-
-async def motor_record_simulator(instance,
-                                 parent,
-                                 async_lib,
-                                 defaults=None,
-                                 tick_rate_hz=10.):
-    """
-    A simple motor record simulator.
-
-    Parameters
-    ----------
-    instance : pvproperty (ChannelDouble)
-        Ensure you set ``record='motor'`` in your pvproperty first.
-
-    enabled: pvproperty (ChannelInt)
-        Wheter the motor is enabled or not
-
-    async_lib : AsyncLibraryLayer
-
-    defaults : dict, optional
-        Defaults for velocity, precision, acceleration, limits, and resolution.
-
-    tick_rate_hz : float, optional
-        Update rate in Hz.
-    """
-    if defaults is None:
-        defaults = dict(
-            velocity=0.1,
-            precision=3,
-            acceleration=1.0,
-            resolution=1e-6,
-            tick_rate_hz=10.,
-            user_limits=(0.0, 100.0),
-        )
-
-    fields = instance.field_inst  # type: MotorFields
-    have_new_position = False
-
-    async def value_write_hook(fields, value):
-        nonlocal have_new_position
-        # This happens when a user puts to `motor.VAL`
-        # print("New position requested!", value)
-        have_new_position = True
-
-    fields.value_write_hook = value_write_hook
-
-    await instance.write_metadata(precision=defaults['precision'])
-    await broadcast_precision_to_fields(instance)
-
-    await fields.velocity.write(defaults['velocity'])
-    await fields.seconds_to_velocity.write(defaults['acceleration'])
-    await fields.motor_step_size.write(defaults['resolution'])
-    await fields.user_low_limit.write(defaults['user_limits'][0])
-    await fields.user_high_limit.write(defaults['user_limits'][1])
-    await fields.limit_violation.write(0)
-
-    while True:
-        dwell = 1. / tick_rate_hz
-        if not parent.can_move:
-            await async_lib.library.sleep(dwell)
-            continue
-
-        target_pos = instance.value
-        diff = (target_pos - fields.user_readback_value.value)
-        # compute the total movement time based an velocity
-        total_time = abs(diff / fields.velocity.value)
-        # compute how many steps, should come up short as there will
-        # be a final write of the return value outside of this call
-        num_steps = int(total_time // dwell)
-        if abs(diff) < 1e-9 and not have_new_position:
-            if fields.stop.value != 0:
-                await fields.stop.write(0)
-            await async_lib.library.sleep(dwell)
-            continue
-
-        if fields.stop.value != 0:
-            await fields.stop.write(0)
-
-        await fields.done_moving_to_value.write(0)
-        await fields.motor_is_moving.write(1)
-
-        readback = fields.user_readback_value.value
-        step_size = diff / num_steps if num_steps > 0 else 0.0
-        resolution = max((fields.motor_step_size.value, 1e-10))
-
-        for _ in range(num_steps):
-            if fields.stop.value != 0:
-                await fields.stop.write(0)
-                await instance.write(readback)
-                break
-            if fields.stop_pause_move_go.value == 'Stop':
-                await instance.write(readback)
-                break
-
-            readback += step_size
-            raw_readback = readback / resolution
-            await fields.user_readback_value.write(readback)
-            await fields.dial_readback_value.write(readback)
-            await fields.raw_readback_value.write(raw_readback)
-            await async_lib.library.sleep(dwell)
-        else:
-            # Only executed if we didn't break
-            await fields.user_readback_value.write(target_pos)
-
-        await fields.motor_is_moving.write(0)
-        await fields.done_moving_to_value.write(1)
-        have_new_position = False
+from _motor_common import CanMoveEventMixin, motor_record_simulator
 
 
 class FakeRangeSelector(PVGroup):
@@ -150,12 +34,12 @@ class FakePitchSelector(PVGroup):
                         name='P{index}:Select',
                         dtype=bool,
                         enum_strings=['true', 'false'])
-    enable_rbv = pvproperty(value=0,
+    enable_rbv = pvproperty(value='false',
                             name='P{index}:Selected',
                             dtype=bool,
                             read_only=True,
                             enum_strings=['true', 'false'])
-    selectable = pvproperty(value=0,
+    selectable = pvproperty(value='true',
                             name='P{index}:Selectable',
                             dtype=bool,
                             enum_strings=['true', 'false'])
@@ -163,24 +47,36 @@ class FakePitchSelector(PVGroup):
     def __init__(self, *args, mcu_index, **kwargs):
         super().__init__(*args, **kwargs)
         self.mcu_index = mcu_index
+        self.index = int(self.macros['index'])
+        # mirrors enable_rbv, kept as a bool to avoid enum string compares
+        self._enabled = False
+
+    def is_selectable(self):
+        return self._enabled or self.parent.can_enable()[self.mcu_index - 1]
 
     @selectable.getter
     async def selectable(self, instance):
-        if self.enable_rbv.value == 'true':
-            return 'true'
-        return self.parent.can_enable()[self.mcu_index - 1]
+        return 'true' if self.is_selectable() else 'false'
 
     @enable.putter
     async def enable(self, instance, value):
-        if self.selectable.value == 'false':
+        if not self.is_selectable():
             return
         if value == 'false':
             return
-        current = True if self.enable_rbv.value == "true" else False
-        await self.enable_rbv.write(not current)
+        self._enabled = not self._enabled
+        await self.enable_rbv.write('true' if self._enabled else 'false')
+        self.parent.set_pitch_enabled(self.index, self._enabled)
 
 
-class FakeMotor(PVGroup):
+def _pitch_selector(index):
+    return SubGroup(FakePitchSelector,
+                    prefix='SEL2:',
+                    macros={'index': index},
+                    mcu_index=1 if index <= 18 else 2)
+
+
+class FakeMotor(CanMoveEventMixin, PVGroup):
     motor = pvproperty(value=0.0,
                        name='MCU{index}',
                        record='motor',
@@ -210,6 +106,7 @@ class FakeMotor(PVGroup):
 
     @motor.startup
     async def motor(self, instance, async_lib):
+        self.start_can_move_event()
         # Start the simulator:
         await motor_record_simulator(self.motor,
                                      self,
@@ -235,150 +132,43 @@ class FakeSeleneIOC(PVGroup):
     range1 = SubGroup(FakeRangeSelector, prefix='SEL2:', macros={'index': 1})
     range2 = SubGroup(FakeRangeSelector, prefix='SEL2:', macros={'index': 2})
 
-    p1 = SubGroup(FakePitchSelector,
-                  prefix='SEL2:',
-                  macros={'index': 1},
-                  mcu_index=1)
-    p2 = SubGroup(FakePitchSelector,
-                  prefix='SEL2:',
-                  macros={'index': 2},
-                  mcu_index=1)
-    p3 = SubGroup(FakePitchSelector,
-                  prefix='SEL2:',
-                  macros={'index': 3},
-                  mcu_index=1)
-    p4 = SubGroup(FakePitchSelector,
-                  prefix='SEL2:',
-                  macros={'index': 4},
-                  mcu_index=1)
-    p5 = SubGroup(FakePitchSelector,
-                  prefix='SEL2:',
-                  macros={'index': 5},
-                  mcu_index=1)
-    p6 = SubGroup(FakePitchSelector,
-                  prefix='SEL2:',
-                  macros={'index': 6},
-                  mcu_index=1)
-    p7 = SubGroup(FakePitchSelector,
-                  prefix='SEL2:',
-                  macros={'index': 7},
-                  mcu_index=1)
-    p8 = SubGroup(FakePitchSelector,
-                  prefix='SEL2:',
-                  macros={'index': 8},
-                  mcu_index=1)
-    p9 = SubGroup(FakePitchSelector,
-                  prefix='SEL2:',
-                  macros={'index': 9},
-                  mcu_index=1)
-    p10 = SubGroup(FakePitchSelector,
-                   prefix='SEL2:',
-                   macros={'index': 10},
-                   mcu_index=1)
-    p11 = SubGroup(FakePitchSelector,
-                   prefix='SEL2:',
-                   macros={'index': 11},
-                   mcu_index=1)
-    p12 = SubGroup(FakePitchSelector,
-                   prefix='SEL2:',
-                   macros={'index': 12},
-                   mcu_index=1)
-    p13 = SubGroup(FakePitchSelector,
-                   prefix='SEL2:',
-                   macros={'index': 13},
-                   mcu_index=1)
-    p14 = SubGroup(FakePitchSelector,
-                   prefix='SEL2:',
-                   macros={'index': 14},
-                   mcu_index=1)
-    p15 = SubGroup(FakePitchSelector,
-                   prefix='SEL2:',
-                   macros={'index': 15},
-                   mcu_index=1)
-    p16 = SubGroup(FakePitchSelector,
-                   prefix='SEL2:',
-                   macros={'index': 16},
-                   mcu_index=1)
-    p17 = SubGroup(FakePitchSelector,
-                   prefix='SEL2:',
-                   macros={'index': 17},
-                   mcu_index=1)
-    p18 = SubGroup(FakePitchSelector,
-                   prefix='SEL2:',
-                   macros={'index': 18},
-                   mcu_index=1)
-    p19 = SubGroup(FakePitchSelector,
-                   prefix='SEL2:',
-                   macros={'index': 19},
-                   mcu_index=2)
-    p20 = SubGroup(FakePitchSelector,
-                   prefix='SEL2:',
-                   macros={'index': 20},
-                   mcu_index=2)
-    p21 = SubGroup(FakePitchSelector,
-                   prefix='SEL2:',
-                   macros={'index': 21},
-                   mcu_index=2)
-    p22 = SubGroup(FakePitchSelector,
-                   prefix='SEL2:',
-                   macros={'index': 22},
-                   mcu_index=2)
-    p23 = SubGroup(FakePitchSelector,
-                   prefix='SEL2:',
-                   macros={'index': 23},
-                   mcu_index=2)
-    p24 = SubGroup(FakePitchSelector,
-                   prefix='SEL2:',
-                   macros={'index': 24},
-                   mcu_index=2)
-    p25 = SubGroup(FakePitchSelector,
-                   prefix='SEL2:',
-                   macros={'index': 25},
-                   mcu_index=2)
-    p26 = SubGroup(FakePitchSelector,
-                   prefix='SEL2:',
-                   macros={'index': 26},
-                   mcu_index=2)
-    p27 = SubGroup(FakePitchSelector,
-                   prefix='SEL2:',
-                   macros={'index': 27},
-                   mcu_index=2)
-    p28 = SubGroup(FakePitchSelector,
-                   prefix='SEL2:',
-                   macros={'index': 28},
-                   mcu_index=2)
-    p29 = SubGroup(FakePitchSelector,
-                   prefix='SEL2:',
-                   macros={'index': 29},
-                   mcu_index=2)
-    p30 = SubGroup(FakePitchSelector,
-                   prefix='SEL2:',
-                   macros={'index': 30},
-                   mcu_index=2)
-    p31 = SubGroup(FakePitchSelector,
-                   prefix='SEL2:',
-                   macros={'index': 31},
-                   mcu_index=2)
-    p32 = SubGroup(FakePitchSelector,
-                   prefix='SEL2:',
-                   macros={'index': 32},
-                   mcu_index=2)
-    p33 = SubGroup(FakePitchSelector,
-                   prefix='SEL2:',
-                   macros={'index': 33},
-                   mcu_index=2)
-    p34 = SubGroup(FakePitchSelector,
-                   prefix='SEL2:',
-                   macros={'index': 34},
-                   mcu_index=2)
-    p35 = SubGroup(FakePitchSelector,
-                   prefix='SEL2:',
-                   macros={'index': 35},
-                   mcu_index=2)
-    p36 = SubGroup(FakePitchSelector,
-                   prefix='SEL2:',
-                   macros={'index': 36},
-                   mcu_index=2)
+    # SEL2:P1..P18 belong to MCU1, SEL2:P19..P36 to MCU2
+    p1 = _pitch_selector(1)
+    p2 = _pitch_selector(2)
+    p3 = _pitch_selector(3)
+    p4 = _pitch_selector(4)
+    p5 = _pitch_selector(5)
+    p6 = _pitch_selector(6)
+    p7 = _pitch_selector(7)
+    p8 = _pitch_selector(8)
+    p9 = _pitch_selector(9)
+    p10 = _pitch_selector(10)
+    p11 = _pitch_selector(11)
+    p12 = _pitch_selector(12)
+    p13 = _pitch_selector(13)
+    p14 = _pitch_selector(14)
+    p15 = _pitch_selector(15)
+    p16 = _pitch_selector(16)
+    p17 = _pitch_selector(17)
+    p18 = _pitch_selector(18)
+    p19 = _pitch_selector(19)
+    p20 = _pitch_selector(20)
+    p21 = _pitch_selector(21)
+    p22 = _pitch_selector(22)
+    p23 = _pitch_selector(23)
+    p24 = _pitch_selector(24)
+    p25 = _pitch_selector(25)
+    p26 = _pitch_selector(26)
+    p27 = _pitch_selector(27)
+    p28 = _pitch_selector(28)
+    p29 = _pitch_selector(29)
+    p30 = _pitch_selector(30)
+    p31 = _pitch_selector(31)
+    p32 = _pitch_selector(32)
+    p33 = _pitch_selector(33)
+    p34 = _pitch_selector(34)
+    p35 = _pitch_selector(35)
+    p36 = _pitch_selector(36)
 
     mcu1 = SubGroup(FakeMotor,
                     velocity=1.,
@@ -395,39 +185,32 @@ class FakeSeleneIOC(PVGroup):
                     prefix='SEL2:',
                     macros={'index': 2})
 
+    # one bit per pitch selector, MCU1 in the low 18 bits, MCU2 above
+    _PITCHES_PER_MCU = 18
+    _MCU_MASK = (1 << _PITCHES_PER_MCU) - 1
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._enable_mask = 0
+
+    def set_pitch_enabled(self, index, enabled):
+        bit = 1 << (index - 1)
+        if enabled:
+            self._enable_mask |= bit
+        else:
+            self._enable_mask &= ~bit
+        for motor in (self.mcu1, self.mcu2):
+            motor.update_can_move_event()
+
     def can_move(self):
-        return (any([
-            pitch.enable_rbv.value in ['true', 1]
-            for pitch in (self.p1, self.p2, self.p3, self.p4, self.p5, self.p6,
-                          self.p7, self.p8, self.p9, self.p10, self.p11,
-                          self.p12, self.p13, self.p14, self.p15, self.p16,
-                          self.p17, self.p18)
-        ]),
-                any([
-                    pitch.enable_rbv.value in ['true', 1]
-                    for pitch in (self.p19, self.p20, self.p21, self.p22,
-                                  self.p23, self.p24, self.p25, self.p26,
-                                  self.p27, self.p28, self.p29, self.p30,
-                                  self.p31, self.p32, self.p33, self.p34,
-                                  self.p35, self.p36)
-                ]))
+        mask = self._enable_mask
+        return (bool(mask & self._MCU_MASK),
+                bool(mask & (self._MCU_MASK << self._PITCHES_PER_MCU)))
 
     def can_enable(self):
-        return (all([
-            pitch.enable_rbv.value in ['true', 0]
-            for pitch in (self.p1, self.p2, self.p3, self.p4, self.p5, self.p6,
-                          self.p7, self.p8, self.p9, self.p10, self.p11,
-                          self.p12, self.p13, self.p14, self.p15, self.p16,
-                          self.p17, self.p18)
-        ]),
-                all([
-                    pitch.enable_rbv.value in ['true', 0]
-                    for pitch in (self.p19, self.p20, self.p21, self.p22,
-                                  self.p23, self.p24, self.p25, self.p26,
-                                  self.p27, self.p28, self.p29, self.p30,
-                                  self.p31, self.p32, self.p33, self.p34,
-                                  self.p35, self.p36)
-                ]))
+        mask = self._enable_mask
+        return (not mask & self._MCU_MASK,
+                not mask & (self._MCU_MASK << self._PITCHES_PER_MCU))
 
 
 if __name__ == '__main__':
@@ -3,18 +3,30 @@
 from caproto.server import PVGroup, ioc_arg_parser, pvproperty, run, SubGroup
 
 import asyncio
+import logging
+import socket
+
+from _logging import configure_logging
+
+logger = logging.getLogger('epicssim.gaspump')
 
 HOST = '127.0.0.1'
 PORT = 3001
 
 
 async def connect(instance):
+    attempt = 0
     while True:
         try:
             instance.reader, instance.writer = await asyncio.open_connection(instance.host, instance.port)
-        except ConnectionRefusedError:
-            await asyncio.sleep(5)
+        except OSError:
+            await asyncio.sleep(min(5, 0.1 * 2 ** attempt))
+            attempt = min(attempt + 1, 6)
             continue
+        sock = instance.writer.get_extra_info('socket')
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        return
 
 
 class GasPumpController:
@@ -25,16 +37,30 @@ class GasPumpController:
         self.writer = None
         self.host = host
         self.port = port
+        # created on first use, inside the running event loop
+        self._lock = None
 
     async def send(self, message):
-        try:
-            self.writer.write(message.encode())
-            await self.writer.drain()
-            data = await self.reader.read(1024)
-
-        except (ConnectionResetError, AttributeError):
-            await connect(self)
-        print(f'Received: {data.decode()!r}')
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # one request/response exchange at a time on the shared stream
+        async with self._lock:
+            try:
+                self.writer.write(message.encode())
+                await self.writer.drain()
+                data = await self.reader.read(1024)
+            except (OSError, AttributeError):
+                data = b''
+            if not data:
+                # the peer closed the connection or it was never opened
+                logger.warning('No reply from %s:%s, reconnecting; '
+                               'message %r was lost',
+                               self.host, self.port, message)
+                if self.writer is not None:
+                    self.writer.close()
+                await connect(self)
+                return
+        logger.debug('Received: %r', data.decode())
 
 
 class gaspumpIOC(PVGroup):
@@ -47,8 +73,10 @@ class gaspumpIOC(PVGroup):
     mode_rbv = pvproperty(value=1, name='Mode_RBV', dtype=int, read_only=True)
     error = pvproperty(value='', name='Error', dtype=str)
 
-    controller = GasPumpController()
-
+    def __init__(self, *args, host=HOST, port=PORT, **kwargs):
+        super().__init__(*args, **kwargs)
+        # each channel owns its connection, so ch1 and ch2 never share streams
+        self.controller = GasPumpController(host=host, port=port)
 
     # @phase.putter
     # async def phase(self, instance, value):
@@ -74,5 +102,7 @@ if __name__ == '__main__':
         default_prefix='SQ:DMC:gaspump:',
         desc='Run an IOC that simulate the DMC gaspump'
     )
+    # follow the level of the caproto logger, -vv enables the debug records
+    configure_logging(logger, logging.getLogger('caproto').getEffectiveLevel())
     ioc = GaspumpSim(**ioc_options)
     run(ioc.pvdb, **run_options)
\ No newline at end of file